@@ -1,22 +1,89 @@
-import gzip
+import asyncio
+import io
+import os
+import stat
 import sys
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import AsyncIterator, Callable
+from typing import AsyncIterator, Callable, Iterator
+from xml.etree import ElementTree
+
+try:
+    from isal import isal_zlib as zlib
+
+    _MAX_GZIP_LEVEL = 3
+except ImportError:
+    import zlib
+
+    _MAX_GZIP_LEVEL = 9
 
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.server import Context
 from mcp.server.session import ServerSession
 from practiso_sdk import build
+from practiso_sdk.archive import QuizContainer
 from practiso_sdk.build import Builder
 
 from state_tracking import BuildingStateTracker, Head
 
+def _gzip_level_from_env() -> int:
+    raw = os.environ.get("PRACTISO_GZIP_LEVEL", "1")
+    try:
+        level = int(raw)
+    except ValueError:
+        print(
+            f"Warning: ignoring malformed PRACTISO_GZIP_LEVEL {raw!r}",
+            file=sys.stderr,
+        )
+        return 1
+    return max(0, min(level, _MAX_GZIP_LEVEL))
+
+
+_GZIP_LEVEL = _gzip_level_from_env()
+
+
+def _iter_archive_bytes(
+    archive: QuizContainer, chunk_size: int = 1 << 20
+) -> Iterator[bytes]:
+    """Yield the archive serialization in bounded chunks, mirroring
+    `QuizContainer.to_bytes`, so resources are streamed into the
+    compressor instead of being materialized in one buffer."""
+    yield ElementTree.tostring(
+        archive.to_xml_element(),
+        xml_declaration=True,
+        encoding="utf-8",
+        short_empty_elements=False,
+    )
+    if len(archive.resources) <= 0:
+        return
+    yield b"\x00"
+    for name, content in archive.resources.items():
+        yield name.encode("utf-8")
+        yield b"\x00"
+        content.seek(0, io.SEEK_END)
+        yield content.tell().to_bytes(4)
+        content.seek(0)
+        while chunk := content.read(chunk_size):
+            yield chunk
+        content.seek(0)
+
+
+def _gzip_write_archive(path: Path | str, archive: QuizContainer):
+    # wbits=31 makes the deflate stream a gzip member, with header and
+    # CRC handled in C instead of GzipFile's per-write bookkeeping.
+    compressor = zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED, 31)
+    with open(path, "wb", buffering=256 * 1024) as fd:
+        for chunk in _iter_archive_bytes(archive):
+            data = compressor.compress(chunk)
+            if data:
+                fd.write(data)
+        fd.write(compressor.flush())
+
 
 def main(transport="stdio"):
-    @dataclass
+    @dataclass(slots=True)
     class AppContext:
         quiz_builder: Builder
         state: BuildingStateTracker
@@ -31,11 +98,12 @@ def main(transport="stdio"):
         finally:
             if state.valid and not state.built:
                 archive = await builder.build()
+                now = datetime.now()
                 save_name = (
-                    f'unsaved_{datetime.now().strftime("%Y%m%d_%H%M%S")}.psarchive'
+                    f"unsaved_{now.year:04d}{now.month:02d}{now.day:02d}"
+                    f"_{now.hour:02d}{now.minute:02d}{now.second:02d}.psarchive"
                 )
-                with gzip.open(save_name, "wb") as fd:
-                    fd.write(archive.to_bytes())
+                await asyncio.to_thread(_gzip_write_archive, save_name, archive)
             elif not state.valid and not state.empty:
                 print(
                     f"Warning: archive was left invalid at {state.head.name} and was UNSAVED",
@@ -54,7 +122,7 @@ def main(transport="stdio"):
                 actions[0]
                 if len(actions) == 1
                 else "; ".join(
-                    f"{index+1}. {option}" for (index, option) in enumerate(actions)
+                    [f"{i+1}. {actions[i]}" for i in range(len(actions))]
                 )
             )
             + "."
@@ -67,19 +135,20 @@ def main(transport="stdio"):
             return items[0]
         if len(items) == 2:
             return f"{items[0]} and {items[1]}"
-        return ", ".join(items[:-2]) + ", " + _format_and_clause(items[-2:])
+        return ", ".join(items[:-1]) + ", and " + items[-1]
 
     def _assert_valid(
         is_valid: bool, instructions: str | Callable[[], str] | None = None
     ):
         if not is_valid:
-            raise RuntimeError(
-                "you are in an illegal state" + f"; {instructions}"
-                if isinstance(instructions, str)
-                else instructions() if isinstance(instructions, Callable) else ""
-            )
+            msg = "you are in an illegal state"
+            if isinstance(instructions, Callable):
+                instructions = instructions()
+            if instructions:
+                msg = f"{msg}; {instructions}"
+            raise RuntimeError(msg)
 
-    def _get_available_actions(current_head: Head) -> str:
+    def _get_available_actions(current_head: Head) -> list[str]:
         if current_head == Head.option:
             return [
                 "add an image",
@@ -93,31 +162,39 @@ def main(transport="stdio"):
         if current_head == Head.root:
             return ["save the all quiz(zes) into an archive file", "begin another quiz"]
 
+    _actions_message = {
+        head: _format_available_actions(_get_available_actions(head)) for head in Head
+    }
+    _text_heads = Head.quiz | Head.option
+
     @mcp.tool()
     def begin_quiz(ctx: ContextType, name: str | None) -> str:
         """Ask the builder to begin a quiz. Name it with context. Use this tool ONLY IF either: 1. the last quiz has been ended; 2. it's the first time use."""
         context = ctx.request_context.lifespan_context
-        _assert_valid(context.state.head == Head.root)
+        state = context.state
+        _assert_valid(state.head == Head.root)
         context.quiz_builder.begin_quiz(name=name)
-        context.state.increase_level()
+        state.increase_level()
         return "Quiz begun. Now you can add content to the quiz."
 
     @mcp.tool()
-    def end_quiz(ctx: ContextType):
+    def end_quiz(ctx: ContextType) -> str:
         """Ask the builder to end the current quiz, making the future incoming content in a separate one. Use only there's an ongoing quiz."""
         context = ctx.request_context.lifespan_context
-        _assert_valid(context.state.head == Head.quiz)
+        state = context.state
+        _assert_valid(state.head == Head.quiz)
         context.quiz_builder.end_quiz()
-        context.state.decrease_level()
-        return f"Quiz ended. {_format_available_actions(_get_available_actions(context.state.head))}"
+        state.decrease_level()
+        return f"Quiz ended. {_actions_message[state.head]}"
 
     @mcp.tool()
     def add_text(ctx: ContextType, content: str) -> str:
         """Ask the builder to add a piece of text to the ongoing quiz. Use only if there's currently an onging quiz."""
         context = ctx.request_context.lifespan_context
-        _assert_valid(context.state.head in [Head.quiz, Head.option])
+        state = context.state
+        _assert_valid(bool(state.head & _text_heads))
         context.quiz_builder.add_text(content)
-        return f"Text added. {_format_available_actions(_get_available_actions(context.state.head))}"
+        return f"Text added. {_actions_message[state.head]}"
 
     @mcp.tool()
     def add_image(ctx: ContextType, file_path: str, caption: str | None = None) -> str:
@@ -129,39 +206,43 @@ def main(transport="stdio"):
         context.quiz_builder.begin_image(alt_text=caption).attach_image_file(
             file_path
         ).end_image()
-        return f"Image added. {_format_available_actions(_get_available_actions(context.state.head))}"
+        return f"Image added. {_actions_message[context.state.head]}"
 
     @mcp.tool()
     def begin_options(ctx: ContextType, name: str | None = None) -> str:
         """Ask the builder to begin an Options, which is the container of multiple Option, serving as choices. The user can interact with them by choosing one or several of the assumed answers. You don't have to but can give the Options a descriptive name."""
         context = ctx.request_context.lifespan_context
+        state = context.state
         context.quiz_builder.begin_options(name)
-        context.state.increase_level()
-        return f"Options begun. {_format_available_actions(_get_available_actions(context.state.head))}"
+        state.increase_level()
+        return f"Options begun. {_actions_message[state.head]}"
 
     @mcp.tool()
     def begin_option(ctx: ContextType, is_answer_key: bool, priority: int = 0) -> str:
         """Ask the builder to begin an Option, which is the container of ONE text or image item. The user can do either: 1. single choice if only one of the Option in the current Options container is marked as the answer key, or 2. multiple choice if more than one is marked as answer key. Reorder the Option when necessary using the `priority` parameter, higher the value the prior. Same priority means random order when presented to the user. Adding more text or image items will OVERWRITE the previous one. Use this tool only if there's an Options container currently onging."""
         context = ctx.request_context.lifespan_context
+        state = context.state
         context.quiz_builder.begin_option(is_key=is_answer_key, priority=priority)
-        context.state.increase_level()
-        return f"Option begun. {_format_available_actions(_get_available_actions(context.state.head))}"
+        state.increase_level()
+        return f"Option begun. {_actions_message[state.head]}"
 
     @mcp.tool()
     def end_option(ctx: ContextType) -> str:
         """Ask the builder to end the Option. This will bring back the last onging Options. Only use after you have begun an Option and added content to it."""
         context = ctx.request_context.lifespan_context
+        state = context.state
         context.quiz_builder.end_option()
-        context.state.decrease_level()
-        return f"Option ended. {_format_available_actions(_get_available_actions(context.state.head))}"
+        state.decrease_level()
+        return f"Option ended. {_actions_message[state.head]}"
 
     @mcp.tool()
     def end_options(ctx: ContextType) -> str:
         """Ask the builder to end the Options. Use only after you have begun an Options and added content to it."""
         context = ctx.request_context.lifespan_context
+        state = context.state
         context.quiz_builder.end_options()
-        context.state.decrease_level()
-        return f"Options ended. {_format_available_actions(_get_available_actions(context.state.head))}"
+        state.decrease_level()
+        return f"Options ended. {_actions_message[state.head]}"
 
     @mcp.tool()
     async def save(ctx: ContextType, path: str) -> str:
@@ -170,23 +251,27 @@ def main(transport="stdio"):
         _path = Path(path)
         if not _path.is_absolute():
             raise ValueError("path is not absolute")
-        if _path.is_dir():
-            raise ValueError("path is an existing directory")
-        if _path.is_file():
-            raise ValueError("path is an existing file which you may not overwrite")
         if _path.suffix != ".psarchive":
             raise ValueError("path doesn't end with `.psarchive`")
+        try:
+            st = os.stat(_path)
+        except FileNotFoundError:
+            pass
+        else:
+            if stat.S_ISDIR(st.st_mode):
+                raise ValueError("path is an existing directory")
+            raise ValueError("path is an existing file which you may not overwrite")
 
         context = ctx.request_context.lifespan_context
-        _assert_valid(not context.state.empty, instructions="begin a quiz first")
+        state = context.state
+        _assert_valid(not state.empty, instructions="begin a quiz first")
         _assert_valid(
-            context.state.valid,
-            instructions=lambda: f"end the {_format_and_clause(list(head for head in (Head(i).name for i in range(context.state.level, 0, -1))))}",
+            state.valid,
+            instructions=lambda: f"end the {_format_and_clause([Head.at_level(i).name for i in range(state.level, 0, -1)])}",
         )
 
-        with gzip.open(_path, "wb") as fd:
-            content = await context.quiz_builder.build()
-            fd.write(content.to_bytes())
+        content = await context.quiz_builder.build()
+        await asyncio.to_thread(_gzip_write_archive, _path, content)
         return f"Your edit has been saved to `{_path}`"
 
     @mcp.tool()
@@ -1,11 +1,18 @@
-from enum import Enum
+from enum import IntFlag
 
 
-class Head(Enum):
-    root = 0
-    quiz = 1
-    options = 2
-    option = 3
+class Head(IntFlag):
+    root = 1
+    quiz = 2
+    options = 4
+    option = 8
+
+    @classmethod
+    def at_level(cls, level: int) -> "Head":
+        return _HEAD_BY_LEVEL[level]
+
+
+_HEAD_BY_LEVEL = (Head.root, Head.quiz, Head.options, Head.option)
 
 
 class BuildingStateTracker:
@@ -24,7 +31,7 @@ class BuildingStateTracker:
 
     @property
     def head(self) -> Head:
-        return Head(self.__level)
+        return _HEAD_BY_LEVEL[self.__level]
 
     def increase_level(self):
         self.__empty = False